@@ -5,7 +5,11 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import joblib
+import xlsxwriter
+from numba import njit, prange
+from sklearn.preprocessing import MinMaxScaler
 from io import BytesIO
+from itertools import chain
 
 ###############################################################################
 # 0. CONFIG & CONSTANTS
@@ -34,96 +38,275 @@ SELECTED_FEATS = [
     'Aktif Karlılık (%)', 'ROCE Oranı', 'Finansman Gider / Net Satış'
 ]
 
+# Column order of the ratios in the downloaded sheet (the order they were
+# historically computed in), independent of the model's SELECTED_FEATS order
+EXPORT_ORDER = (
+    'Cari Oran', 'Asit Test Oranı', 'Nakit Oranı', 'Faaliyet Kar Marjı',
+    'Esas Faaliyet Kar Marjı', 'Brüt Kar Marjı (%)', 'Net Kar Marjı',
+    'FAVÖK / Kısa Vade Borç', 'Aktif Devir Hızı', 'Alacak Devir Hızı',
+    'Dönen Varlıklar Devir Hızı', 'Ticari Borçlar Devir Hızı', 'Stok Devir Hızı',
+    'Borç Kaynak Oranı', 'Finansal Kaldıraç', 'Özsermaye / Aktif',
+    'Özsermaye / Maddi Duran Varlıklar', 'Duran Varlıklar / Maddi Özkaynak',
+    'Duran Varlıklar / Aktif ', 'Dönen Varlıklar / Aktif (%)',
+    'Kısa Vade Borç / Aktif', 'Kısa Vade Borç / Dönen Varlık',
+    'Kısa Vade Borç / Özsermaye', 'Kısa Vade Borç / Toplam Borç',
+    'Net Satışlar / Kısa Vade Borç', 'Esas Faaliyet Karı / Kısa Vadeli Borç',
+    'Aktif Karlılık (%)', 'ROCE Oranı', 'Finansman Gider / Net Satış',
+    'Altman Z-Skoru', 'Zmijewski Skoru', 'L Model Skoru',
+)
+
+# Raw balance-sheet / income-statement rows the ratios are built from
+# (one row each in the _ratios_kernel input matrix)
+REQUIRED_COLS = (
+    'Dönen Varlıklar', 'Duran Varlıklar', 'Kısa Vadeli Yükümlülükler',
+    'Uzun Vadeli Yükümlülükler', 'Stoklar', 'Diğer Dönen Varlıklar',
+    'Nakit ve Nakit Benzerleri', 'Ticari Alacaklar', 'Maddi Duran Varlıklar',
+    'Maddi Olmayan Duran Varlıklar', 'Ticari Borçlar', 'Özkaynaklar',
+    'Geçmiş Yıllar Kar/Zararları', 'Satış Gelirleri', 'Satışların Maliyeti (-)',
+    'Ticari Faaliyetlerden Brüt Kar (Zarar)', 'FAALİYET KARI (ZARARI)',
+    'Net Faaliyet Kar/Zararı', 'Finansman Giderleri',
+    'SÜRDÜRÜLEN FAALİYETLER VERGİ ÖNCESİ KARI (ZARARI)', 'Dönem Net Kar/Zararı',
+)
+
+# Row of every input item in the kernel's K×N input matrix, resolved by name
+# the same way as the output columns below, so reordering REQUIRED_COLS can
+# never feed the wrong item into a ratio
+_IN_DON_VAR          = REQUIRED_COLS.index('Dönen Varlıklar')
+_IN_DURAN_VAR        = REQUIRED_COLS.index('Duran Varlıklar')
+_IN_KVY              = REQUIRED_COLS.index('Kısa Vadeli Yükümlülükler')
+_IN_UVY              = REQUIRED_COLS.index('Uzun Vadeli Yükümlülükler')
+_IN_STOK             = REQUIRED_COLS.index('Stoklar')
+_IN_DIGER_DON        = REQUIRED_COLS.index('Diğer Dönen Varlıklar')
+_IN_NAKIT            = REQUIRED_COLS.index('Nakit ve Nakit Benzerleri')
+_IN_TIC_ALACAK       = REQUIRED_COLS.index('Ticari Alacaklar')
+_IN_MADDI_DV         = REQUIRED_COLS.index('Maddi Duran Varlıklar')
+_IN_MADDI_OLMAYAN_DV = REQUIRED_COLS.index('Maddi Olmayan Duran Varlıklar')
+_IN_TIC_BORC         = REQUIRED_COLS.index('Ticari Borçlar')
+_IN_OZK              = REQUIRED_COLS.index('Özkaynaklar')
+_IN_GECMIS_KAR       = REQUIRED_COLS.index('Geçmiş Yıllar Kar/Zararları')
+_IN_SATIS            = REQUIRED_COLS.index('Satış Gelirleri')
+_IN_SMM              = REQUIRED_COLS.index('Satışların Maliyeti (-)')
+_IN_BRUT_KAR         = REQUIRED_COLS.index('Ticari Faaliyetlerden Brüt Kar (Zarar)')
+_IN_FAAL_KAR         = REQUIRED_COLS.index('FAALİYET KARI (ZARARI)')
+_IN_ESAS_FAAL_KAR    = REQUIRED_COLS.index('Net Faaliyet Kar/Zararı')
+_IN_FINANSMAN        = REQUIRED_COLS.index('Finansman Giderleri')
+_IN_VERGI_ONCESI     = REQUIRED_COLS.index('SÜRDÜRÜLEN FAALİYETLER VERGİ ÖNCESİ KARI (ZARARI)')
+_IN_NET_KAR          = REQUIRED_COLS.index('Dönem Net Kar/Zararı')
+
+# Output column of every ratio in the kernel's N×32 array, resolved by name
+# once at import so the kernel can never drift from the model's feature order
+# (Numba freezes these module-level ints into the compiled code)
+_ALTMAN_Z        = SELECTED_FEATS.index('Altman Z-Skoru')
+_FIN_KALDIRAC    = SELECTED_FEATS.index('Finansal Kaldıraç')
+_NAKIT_ORANI     = SELECTED_FEATS.index('Nakit Oranı')
+_AKTIF_DEVIR     = SELECTED_FEATS.index('Aktif Devir Hızı')
+_L_MODEL         = SELECTED_FEATS.index('L Model Skoru')
+_ZMIJEWSKI       = SELECTED_FEATS.index('Zmijewski Skoru')
+_ASIT_TEST       = SELECTED_FEATS.index('Asit Test Oranı')
+_OZK_MDV         = SELECTED_FEATS.index('Özsermaye / Maddi Duran Varlıklar')
+_FAAL_MARJ       = SELECTED_FEATS.index('Faaliyet Kar Marjı')
+_DURAN_MOZK      = SELECTED_FEATS.index('Duran Varlıklar / Maddi Özkaynak')
+_TIC_BORC_DEVIR  = SELECTED_FEATS.index('Ticari Borçlar Devir Hızı')
+_STOK_DEVIR      = SELECTED_FEATS.index('Stok Devir Hızı')
+_BRUT_MARJ       = SELECTED_FEATS.index('Brüt Kar Marjı (%)')
+_CARI_ORAN       = SELECTED_FEATS.index('Cari Oran')
+_ESAS_KVB        = SELECTED_FEATS.index('Esas Faaliyet Karı / Kısa Vadeli Borç')
+_ESAS_MARJ       = SELECTED_FEATS.index('Esas Faaliyet Kar Marjı')
+_OZK_AKTIF       = SELECTED_FEATS.index('Özsermaye / Aktif')
+_ALACAK_DEVIR    = SELECTED_FEATS.index('Alacak Devir Hızı')
+_BORC_KAYNAK     = SELECTED_FEATS.index('Borç Kaynak Oranı')
+_NET_MARJ        = SELECTED_FEATS.index('Net Kar Marjı')
+_SATIS_KVB       = SELECTED_FEATS.index('Net Satışlar / Kısa Vade Borç')
+_KVB_OZK         = SELECTED_FEATS.index('Kısa Vade Borç / Özsermaye')
+_KVB_TB          = SELECTED_FEATS.index('Kısa Vade Borç / Toplam Borç')
+_KVB_AKTIF       = SELECTED_FEATS.index('Kısa Vade Borç / Aktif')
+_KVB_DV          = SELECTED_FEATS.index('Kısa Vade Borç / Dönen Varlık')
+_FAVOK_KVB       = SELECTED_FEATS.index('FAVÖK / Kısa Vade Borç')
+_DURAN_AKTIF     = SELECTED_FEATS.index('Duran Varlıklar / Aktif ')
+_DONEN_AKTIF     = SELECTED_FEATS.index('Dönen Varlıklar / Aktif (%)')
+_DONEN_DEVIR     = SELECTED_FEATS.index('Dönen Varlıklar Devir Hızı')
+_AKTIF_KARLILIK  = SELECTED_FEATS.index('Aktif Karlılık (%)')
+_ROCE            = SELECTED_FEATS.index('ROCE Oranı')
+_FINANSMAN_SATIS = SELECTED_FEATS.index('Finansman Gider / Net Satış')
+
 ###############################################################################
 # 1. HELPER FUNCTIONS
 ###############################################################################
 
-def safe_div(num: pd.Series, denom: pd.Series) -> pd.Series:
+@njit(inline="always")
+def safe_div(num: float, denom: float) -> float:
     """
      Payda 0 (veya NaN) ise sonuç 0 döner.
      Aksi hâlde normal bölüm değeri döner.
     """
-    denom_replaced = denom.replace(0, np.nan)
-    result = num / denom_replaced
-    return result.fillna(0)
-
-
-
-def compute_ratios(df: pd.DataFrame) -> pd.DataFrame:
-    """Calculate all 32 ratios & add them as new columns to *df*."""
-    # --- 1) Standardise header names -------------------------------------------------
-
-
-    # 2) Common aggregates 
-    total_assets = df['Dönen Varlıklar'] + df['Duran Varlıklar']
-    total_liab   = df['Kısa Vadeli Yükümlülükler'] + df['Uzun Vadeli Yükümlülükler']
-
-    # 3) Liquidity ratios 
-    df['Cari Oran']              = safe_div(df['Dönen Varlıklar'], df['Kısa Vadeli Yükümlülükler'])
-    df['Asit Test Oranı']        = safe_div(df['Dönen Varlıklar'] - df['Stoklar'] - df['Diğer Dönen Varlıklar'],
-                                            df['Kısa Vadeli Yükümlülükler'])
-    df['Nakit Oranı']            = safe_div(df['Nakit ve Nakit Benzerleri'], df['Kısa Vadeli Yükümlülükler'])
-
-    #  4) Profitability & margins 
-    df['Faaliyet Kar Marjı']     = safe_div(df['FAALİYET KARI (ZARARI)']*100, df['Satış Gelirleri'])
-    df['Esas Faaliyet Kar Marjı']= safe_div(df['Net Faaliyet Kar/Zararı']*100, df['Satış Gelirleri'])
-    df['Brüt Kar Marjı (%)']     = safe_div(df['Ticari Faaliyetlerden Brüt Kar (Zarar)']*100, df['Satış Gelirleri'])
-    df['Net Kar Marjı']          = safe_div(df['Dönem Net Kar/Zararı']*100, df['Satış Gelirleri'])
-    df['FAVÖK / Kısa Vade Borç'] = safe_div(df['FAALİYET KARI (ZARARI)'], df['Kısa Vadeli Yükümlülükler'])
-
-    #  5) Turnover ratios 
-    df['Aktif Devir Hızı']           = safe_div(df['Satış Gelirleri'], total_assets)
-    df['Alacak Devir Hızı']          = safe_div(df['Satış Gelirleri'], df['Ticari Alacaklar'])
-    df['Dönen Varlıklar Devir Hızı'] = safe_div(df['Dönen Varlıklar'], df['Satış Gelirleri'])
-    df['Ticari Borçlar Devir Hızı']  = -safe_div(df['Satışların Maliyeti (-)'], df['Ticari Borçlar'])
-    df['Stok Devir Hızı']            = -safe_div(df['Satışların Maliyeti (-)'], df['Stoklar'])
-
-    # 6) Capital structure ratios 
-    df['Borç Kaynak Oranı']                 = safe_div(total_liab, df['Özkaynaklar'])*100
-    df['Finansal Kaldıraç']                 = safe_div(total_liab, total_assets)*100
-    df['Özsermaye / Aktif']                = safe_div(df['Özkaynaklar'], total_assets)
-    df['Özsermaye / Maddi Duran Varlıklar'] = safe_div(df['Özkaynaklar'], df['Maddi Duran Varlıklar'])
-    df['Duran Varlıklar / Maddi Özkaynak']  = safe_div(df['Duran Varlıklar'],
-                                                       df['Özkaynaklar'] - df['Maddi Olmayan Duran Varlıklar'])
-    df['Duran Varlıklar / Aktif ']          = safe_div(df['Duran Varlıklar']*100, total_assets)
-    df['Dönen Varlıklar / Aktif (%)']       = safe_div(df['Dönen Varlıklar']*100, total_assets)
-
-    #  7) Short‑term debt focus 
-    df['Kısa Vade Borç / Aktif']          = safe_div(df['Kısa Vadeli Yükümlülükler'], total_assets)
-    df['Kısa Vade Borç / Dönen Varlık']   = safe_div(df['Kısa Vadeli Yükümlülükler'], df['Dönen Varlıklar'])
-    df['Kısa Vade Borç / Özsermaye']      = safe_div(df['Kısa Vadeli Yükümlülükler'], df['Özkaynaklar'])
-    df['Kısa Vade Borç / Toplam Borç']    = safe_div(df['Kısa Vadeli Yükümlülükler'], total_liab)
-    df['Net Satışlar / Kısa Vade Borç']   = safe_div(df['Satış Gelirleri'], df['Kısa Vadeli Yükümlülükler'])
-    df['Esas Faaliyet Karı / Kısa Vadeli Borç'] = safe_div(df['Net Faaliyet Kar/Zararı'], df['Kısa Vadeli Yükümlülükler'])
-
-    #  8) Misc. profitability 
-    df['Aktif Karlılık (%)']  = safe_div(df['Dönem Net Kar/Zararı']*100, total_assets)
-    df['ROCE Oranı']          = safe_div(df['FAALİYET KARI (ZARARI)']*100, total_assets)
-    df['Finansman Gider / Net Satış'] = safe_div(df['Finansman Giderleri'], df['Satış Gelirleri'])
-
-    # 9) Bankruptcy / scoring models
-    # Altman Z inputs
-    X1 = safe_div(df['Dönen Varlıklar'] - df['Kısa Vadeli Yükümlülükler'], total_assets)
-    X2 = safe_div(df['Geçmiş Yıllar Kar/Zararları'] + df['Dönem Net Kar/Zararı'], total_assets)
-    X3 = safe_div(df['SÜRDÜRÜLEN FAALİYETLER VERGİ ÖNCESİ KARI (ZARARI)'], total_assets)
-    X4 = safe_div(df['Özkaynaklar'], total_liab)
-    X5 = safe_div(df['Satış Gelirleri'], total_assets)
-    df['Altman Z-Skoru'] = 1.2*X1 + 1.4*X2 + 3.3*X3 + 0.6*X4 + X5
-
-    # Zmijewski
-    Z1 = safe_div(df['Dönem Net Kar/Zararı'], total_assets)
-    Z2 = safe_div(total_liab, total_assets)
-    Z3 = safe_div(df['Dönen Varlıklar'], df['Kısa Vadeli Yükümlülükler'])
-    df['Zmijewski Skoru'] = -4.3 - 4.5*Z1 + 5.7*Z2 - 0.004*Z3
-
-    # L‑model 
-    L6 = safe_div(safe_div(df['Nakit ve Nakit Benzerleri'], df['Kısa Vadeli Yükümlülükler']), total_liab)
-    L7 = safe_div(total_liab, total_assets)
-    df['L Model Skoru'] = (
-        -0.113*X1 + 0.238*X2 - 0.052*X3 - 0.051*X4 + 0.011*X5 + 0.729*L6 - 0.639*L7
-    )
-
-    return df
+    # Mask-and-select instead of an early return: the row body stays
+    # branch-free and a zero denominator never reaches the divider
+    ok = denom != 0.0
+    result = num / (denom if ok else 1.0)
+    return result if ok & (result == result) else 0.0
+
+
+# Compiled lazily: Streamlit re-executes the script on every interaction, so
+# an eager signature would compile / reload the kernel before the page even
+# renders, including reruns where the ratios come from st.cache_data
+@njit(parallel=True, cache=True)
+def _ratios_kernel(M, out):
+    """Fill *out* (N×32, SELECTED_FEATS order) from *M* (K×N) in a single pass."""
+    don_var          = M[_IN_DON_VAR]
+    duran_var        = M[_IN_DURAN_VAR]
+    kvy              = M[_IN_KVY]
+    uvy              = M[_IN_UVY]
+    stok             = M[_IN_STOK]
+    diger_don        = M[_IN_DIGER_DON]
+    nakit            = M[_IN_NAKIT]
+    tic_alacak       = M[_IN_TIC_ALACAK]
+    maddi_dv         = M[_IN_MADDI_DV]
+    maddi_olmayan_dv = M[_IN_MADDI_OLMAYAN_DV]
+    tic_borc         = M[_IN_TIC_BORC]
+    ozk              = M[_IN_OZK]
+    gecmis_kar       = M[_IN_GECMIS_KAR]
+    satis            = M[_IN_SATIS]
+    smm              = M[_IN_SMM]
+    brut_kar         = M[_IN_BRUT_KAR]
+    faal_kar         = M[_IN_FAAL_KAR]
+    esas_faal_kar    = M[_IN_ESAS_FAAL_KAR]
+    finansman        = M[_IN_FINANSMAN]
+    vergi_oncesi     = M[_IN_VERGI_ONCESI]
+    net_kar          = M[_IN_NET_KAR]
+    for i in prange(out.shape[0]):
+        # Common aggregates
+        ta = don_var[i] + duran_var[i]
+        tl = kvy[i] + uvy[i]
+
+        # Ratios the scoring models reuse, kept in float64 registers
+        cari     = safe_div(don_var[i], kvy[i])
+        nakit_o  = safe_div(nakit[i], kvy[i])
+        devir    = safe_div(satis[i], ta)
+        kaldirac = safe_div(tl, ta)
+
+        # Liquidity ratios
+        out[i, _CARI_ORAN]       = cari
+        out[i, _ASIT_TEST]       = safe_div(don_var[i] - stok[i] - diger_don[i], kvy[i])
+        out[i, _NAKIT_ORANI]     = nakit_o
+
+        # Profitability & margins
+        out[i, _FAAL_MARJ]       = safe_div(faal_kar[i]*100, satis[i])
+        out[i, _ESAS_MARJ]       = safe_div(esas_faal_kar[i]*100, satis[i])
+        out[i, _BRUT_MARJ]       = safe_div(brut_kar[i]*100, satis[i])
+        out[i, _NET_MARJ]        = safe_div(net_kar[i]*100, satis[i])
+        out[i, _FAVOK_KVB]       = safe_div(faal_kar[i], kvy[i])
+
+        # Turnover ratios
+        out[i, _AKTIF_DEVIR]     = devir
+        out[i, _ALACAK_DEVIR]    = safe_div(satis[i], tic_alacak[i])
+        out[i, _DONEN_DEVIR]     = safe_div(don_var[i], satis[i])
+        out[i, _TIC_BORC_DEVIR]  = -safe_div(smm[i], tic_borc[i])
+        out[i, _STOK_DEVIR]      = -safe_div(smm[i], stok[i])
+
+        # Capital structure ratios
+        out[i, _BORC_KAYNAK]     = safe_div(tl, ozk[i])*100
+        out[i, _FIN_KALDIRAC]    = kaldirac*100
+        out[i, _OZK_AKTIF]       = safe_div(ozk[i], ta)
+        out[i, _OZK_MDV]         = safe_div(ozk[i], maddi_dv[i])
+        out[i, _DURAN_MOZK]      = safe_div(duran_var[i], ozk[i] - maddi_olmayan_dv[i])
+        out[i, _DURAN_AKTIF]     = safe_div(duran_var[i]*100, ta)
+        out[i, _DONEN_AKTIF]     = safe_div(don_var[i]*100, ta)
+
+        # Short‑term debt focus
+        out[i, _KVB_AKTIF]       = safe_div(kvy[i], ta)
+        out[i, _KVB_DV]          = safe_div(kvy[i], don_var[i])
+        out[i, _KVB_OZK]         = safe_div(kvy[i], ozk[i])
+        out[i, _KVB_TB]          = safe_div(kvy[i], tl)
+        out[i, _SATIS_KVB]       = safe_div(satis[i], kvy[i])
+        out[i, _ESAS_KVB]        = safe_div(esas_faal_kar[i], kvy[i])
+
+        # Misc. profitability
+        out[i, _AKTIF_KARLILIK]  = safe_div(net_kar[i]*100, ta)
+        out[i, _ROCE]            = safe_div(faal_kar[i]*100, ta)
+        out[i, _FINANSMAN_SATIS] = safe_div(finansman[i], satis[i])
+
+        # Bankruptcy / scoring models
+        # Altman Z inputs
+        X1 = safe_div(don_var[i] - kvy[i], ta)
+        X2 = safe_div(gecmis_kar[i] + net_kar[i], ta)
+        X3 = safe_div(vergi_oncesi[i], ta)
+        X4 = safe_div(ozk[i], tl)
+        X5 = devir
+        out[i, _ALTMAN_Z]        = 1.2*X1 + 1.4*X2 + 3.3*X3 + 0.6*X4 + X5
+
+        # Zmijewski (Z2 = kaldıraç, Z3 = cari oran)
+        Z1 = safe_div(net_kar[i], ta)
+        out[i, _ZMIJEWSKI]       = -4.3 - 4.5*Z1 + 5.7*kaldirac - 0.004*cari
+
+        # L‑model (L7 = kaldıraç)
+        L6 = safe_div(nakit_o, tl)
+        out[i, _L_MODEL]         = (
+            -0.113*X1 + 0.238*X2 - 0.052*X3 - 0.051*X4 + 0.011*X5 + 0.729*L6 - 0.639*kaldirac
+        )
+
+
+
+@st.cache_resource
+def load_model(path: str = MODEL_PATH):
+    """Load the (pipeline, encoder) bundle once and share it across reruns."""
+    pipe, enc = joblib.load(path)
+    # Features arrive as float32; keep the scaler parameters float32 as well so
+    # transform does not run through a float64 loop and XGBoost receives float32.
+    # Only for the layout this bundle ships with; other pipelines are left as is
+    prep = getattr(pipe, "named_steps", {}).get("prep")
+    scaler = getattr(prep, "named_transformers_", {}).get("num")
+    if isinstance(scaler, MinMaxScaler):
+        scaler.scale_ = scaler.scale_.astype(np.float32)
+        scaler.min_ = scaler.min_.astype(np.float32)
+    return pipe, enc
+
+
+@st.cache_data(show_spinner=False)
+def read_sheet(file_bytes: bytes) -> pd.DataFrame:
+    """Parse the vertical workbook into one row per firm; cached on the file contents."""
+    raw_vert = pd.read_excel(BytesIO(file_bytes), header=None, sheet_name=0,
+                             engine="calamine").to_numpy()
+    # Column 0 holds the item names, columns 1..N one firm each. Strip and dedup
+    # the names in one pass (first occurrence wins), then build the horizontal
+    # frame straight from the kept rows
+    keep = np.zeros(len(raw_vert), dtype=bool)
+    names, seen = [], set()
+    for i, name in enumerate(raw_vert[:, 0]):
+        # Like Index.str.strip(): non-string names (blank cells, stray numbers)
+        # become NaN and all of them share one dedup key
+        name = name.strip() if isinstance(name, str) else np.nan
+        key = name if isinstance(name, str) else None
+        if key not in seen:
+            seen.add(key)
+            keep[i] = True
+            names.append(name)
+    raw_df = pd.DataFrame(raw_vert[keep, 1:].T, columns=names)
+    # The object array leaves every column as object; give them real dtypes once
+    # so the ratio kernel reads numeric buffers instead of unboxing Python floats
+    return raw_df.infer_objects()
+
+
+
+def compute_ratios(df: pd.DataFrame) -> np.ndarray:
+    """Calculate all 32 ratios as an N×32 float64 array in SELECTED_FEATS order."""
+    # Resolve all input positions in one lookup and pull them as one C-contiguous
+    # K×N matrix: every input is a stride-1 row the kernel reads in place
+    pos = df.columns.get_indexer(REQUIRED_COLS)
+    if (pos < 0).any():
+        raise KeyError([name for name, p in zip(REQUIRED_COLS, pos) if p < 0])
+    # np.require copies only when needed: a consolidated float64 frame hands back a
+    # read-only view under pandas copy-on-write, which would otherwise make Numba
+    # compile and cache a second, read-only specialisation of the kernel
+    M = np.require(df.iloc[:, pos].to_numpy(dtype=np.float64).T, requirements="CW")
+    out = np.empty((len(df), len(SELECTED_FEATS)), dtype=np.float64)
+    _ratios_kernel(M, out)
+    return out
+
+
+@st.cache_data(show_spinner=False)
+def ratios_for_upload(file_bytes: bytes) -> np.ndarray:
+    """compute_ratios on the uploaded workbook; runs once per distinct file."""
+    return compute_ratios(read_sheet(file_bytes))
 
 
 
@@ -143,16 +326,8 @@ if not file:
 
 
 
-raw_vert = pd.read_excel(BytesIO(file.read()), header=None, sheet_name=0)
-raw_df = (
-    raw_vert
-    .set_index(0)         
-    .T                    
-    .rename_axis(None)   
-    .reset_index(drop=True)
-)
-raw_df.columns = raw_df.columns.str.strip()           
-raw_df = raw_df.loc[:, ~raw_df.columns.duplicated()]  
+file_bytes = file.getvalue()
+raw_df = read_sheet(file_bytes)
 
 st.write("### Dönüştürülmüş Veri", raw_df.head())
 
@@ -160,21 +335,33 @@ st.write("### Dönüştürülmüş Veri", raw_df.head())
 
 # --------------------------------------------------------------------------- 
 with st.spinner("Oranlar hesaplanıyor..."):
-    enriched = compute_ratios(raw_df)           
-    model_input = enriched[SELECTED_FEATS].copy()
-
-# Eksik satırları temizle
-if model_input.isna().any().any():
+    try:
+        feats = ratios_for_upload(file_bytes)
+    except KeyError as exc:
+        st.error(f"Dosyada gerekli kalemler bulunamadı: {', '.join(exc.args[0])}")
+        st.stop()
+    # The model gets float32 (what XGBoost consumes); the report keeps float64.
+    # Validity is checked on the float32 copy so an overflow to inf is caught too
+    X = feats.astype(np.float32)
+    valid = np.isfinite(X).all(axis=1)
+
+# Eksik satırları temizle (tek maske; model girdisi ve çıktı tablosu paylaşır)
+if not valid.all():
     st.warning("Bazı oranlar eksik → ilgili satırlar atlandı.")
-    model_input.dropna(inplace=True)
-if model_input.empty:
+    feats, X = feats[valid], X[valid]
+if not len(X):
     st.error("Hiç analiz edilebilir satır kalmadı.")
     st.stop()
 
+# The pipeline selects columns by name, so wrap the arrays without copying them
+kept_idx = raw_df.index[valid]
+ratios = pd.DataFrame(feats, index=kept_idx, columns=SELECTED_FEATS, copy=False)
+model_input = pd.DataFrame(X, index=kept_idx, columns=SELECTED_FEATS, copy=False)
+
 
 #  Modeli yükle  
 try:
-    pipe, enc = joblib.load(MODEL_PATH)
+    pipe, enc = load_model()
 except FileNotFoundError:
     st.error(f"Model dosyası bulunamadı: {MODEL_PATH}")
     st.stop()
@@ -182,7 +369,7 @@ except FileNotFoundError:
 pred_num   = pipe.predict(model_input)
 pred_label = enc.inverse_transform(pred_num)
 
-out_df = raw_df.loc[model_input.index].copy()
+out_df = raw_df.loc[valid].assign(**{name: ratios[name] for name in EXPORT_ORDER})
 out_df["Tahmin Görüş Tipi"] = pred_label
 
 st.success(f"{len(out_df)} satır başarıyla tahmin edildi.")
@@ -190,9 +377,18 @@ st.write("### Tahmin Sonuçları", out_df[["Tahmin Görüş Tipi"]].head())
 
 @st.cache_data
 def to_xlsx(df: pd.DataFrame) -> bytes:
+    # constant_memory flushes each row as soon as the next one starts, so rows
+    # must arrive strictly in order. DataFrame.to_excel writes column by column
+    # and would silently lose cells in this mode, hence the explicit row loop.
     with BytesIO() as buf:
-        with pd.ExcelWriter(buf, engine="xlsxwriter") as w:
-            df.to_excel(w, index=False, sheet_name="sonuclar")
+        # default_date_format keeps the date cells formatted like to_excel did
+        wb = xlsxwriter.Workbook(buf, {"constant_memory": True, "nan_inf_to_errors": True,
+                                       "default_date_format": "YYYY-MM-DD HH:MM:SS"})
+        ws = wb.add_worksheet("sonuclar")
+        rows = df.itertuples(index=False, name=None)
+        for r, row in enumerate(chain([df.columns], rows)):
+            ws.write_row(r, 0, [None if v != v else v for v in row])  # NaN → boş hücre
+        wb.close()
         return buf.getvalue()
 
 st.download_button(
@@ -203,4 +399,4 @@ st.download_button(
 )
 
 with st.expander("🔍 Kullanılan 32 Özellik"):
-    st.write(model_input.head())
+    st.write(ratios.head())